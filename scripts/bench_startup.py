@@ -0,0 +1,68 @@
+'''
+Startup time benchmark: the old per-script setup vs the shared connection factory
+'''
+import duckdb
+import glob
+import os.path
+import subprocess
+import sys
+import time
+import argparse
+from statistics import median
+
+from connection import get_connection, DATA_DIR
+
+
+def old_startup() -> None:
+    '''
+    What every script used to do before touching data
+    '''
+    conn = duckdb.connect()
+    conn.execute("INSTALL spatial; LOAD spatial;")
+
+    data_dir = os.path.join(DATA_DIR, '**', '*.parquet')
+    data_list = list(filter(lambda x: not os.path.isdir(x), glob.glob(data_dir, recursive=True) ))
+    conn.execute(f"CREATE VIEW ais AS SELECT * FROM read_parquet({data_list})")
+    conn.close()
+
+
+def new_startup() -> None:
+    conn = get_connection()
+    conn.close()
+
+
+def time_it(fn, runs:int) -> float:
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start_time)
+    return median(times)
+
+
+def import_time(module:str, runs:int) -> float:
+    '''
+    Import cost of a module, measured in a fresh interpreter each run
+    '''
+    def run():
+        subprocess.run([sys.executable, '-c', f'import {module}'], check=True)
+    return time_it(run, runs) - time_it(lambda: subprocess.run([sys.executable, '-c', 'pass'], check=True), runs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark script startup time.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs to take the median over.')
+    parser.add_argument('--skip-old', action='store_true', help='Skip the old setup (it needs network access).')
+
+    args = parser.parse_args()
+
+    if not args.skip_old:
+        print(f'Old startup (INSTALL + glob + view): {time_it(old_startup, args.runs):.3f}s')
+    print(f'New startup (get_connection):        {time_it(new_startup, args.runs):.3f}s')
+
+    for module in ['folium', 'shapely', 'jax']:
+        note = ' (now only paid when plotting)' if module == 'folium' else ''
+        try:
+            print(f'import {module}: {import_time(module, args.runs):.3f}s{note}')
+        except subprocess.CalledProcessError:
+            print(f'import {module}: not installed')
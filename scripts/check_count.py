@@ -0,0 +1,41 @@
+'''
+Check that the query service's /count agrees with example_distance.py.
+
+The service adds a bounding box in front of dist_m, so this makes sure the
+box never drops points the plain distance check would keep.
+'''
+import argparse
+import sys
+
+from connection import get_connection
+from query_service import COUNT_SQL, timestamp
+
+# Same query as example_distance.py, without the bounding box
+REFERENCE_SQL = """
+    SELECT COUNT(*)
+    FROM ais
+    WHERE BaseDateTime BETWEEN $start::TIMESTAMP AND $end::TIMESTAMP
+        AND dist_m(LON, LAT, $lon, $lat) < $radius
+"""
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare /count against the example_distance.py query.')
+    # Defaults match example_distance.py (Port of Long Beach)
+    parser.add_argument('--lat', type=float, default=33.755)
+    parser.add_argument('--lon', type=float, default=-118.215)
+    parser.add_argument('--radius', type=float, default=500.0)
+    parser.add_argument('--start', type=timestamp, default='2022-01-01 00:00:00')
+    parser.add_argument('--end', type=timestamp, default='2022-01-06 00:00:00')
+
+    args = parser.parse_args()
+    params = {'lat': args.lat, 'lon': args.lon, 'radius': args.radius, 'start': args.start, 'end': args.end}
+
+    conn = get_connection()
+    expected = conn.execute(REFERENCE_SQL, params).fetchone()[0]
+    actual = conn.execute(COUNT_SQL, params).fetchone()[0]
+    conn.close()
+
+    print(f'example_distance.py: {expected}  /count: {actual}')
+    if expected != actual:
+        print('Mismatch: the /count bounding box is dropping points')
+        sys.exit(1)
@@ -0,0 +1,272 @@
+'''
+Shared DuckDB connection factory for the AIS scripts.
+
+The spatial extension is loaded from a local extension directory (never
+installed at run time) and the `ais` / `ports_data` views plus helper macros
+live in a persistent database file, so each script only has to connect.
+
+One time setup (needs network):
+    python connection.py --install
+'''
+import duckdb
+import argparse
+import time
+from os import environ, makedirs
+from os.path import join, dirname, abspath, exists
+
+REPO_DIR = dirname(dirname(abspath(__file__)))
+
+DATA_DIR = environ.get('AIS_DATA_DIR', '/Users/ella/Documents/luna/ais_data')
+DB_PATH = environ.get('AIS_DB_PATH', join(REPO_DIR, 'ais.duckdb'))
+EXTENSION_DIR = environ.get('AIS_EXTENSION_DIR', join(REPO_DIR, 'extensions'))
+PORTS_FNAME = join(REPO_DIR, 'gps_points', 'ports.csv')
+
+# Bump when the views or macros change so existing databases get rebuilt
+VIEWS_VERSION = '3'
+
+
+def get_port_header() -> dict:
+    schema = {
+                'RANK': 'INTEGER',
+                'NAME': 'VARCHAR',
+                'STATE': 'VARCHAR',
+                'TONNAGE': 'VARCHAR',  # Will be converted to INTEGER when loaded
+                'LAT': 'FLOAT',
+                'LON': 'FLOAT',
+            }
+    return schema
+
+
+def get_config(extension_dir:str=EXTENSION_DIR) -> dict:
+    '''
+    Point DuckDB at the local extension directory and stop it from reaching
+    out to the extension repository on its own
+    '''
+    config = {
+                'extension_directory': extension_dir,
+                'autoinstall_known_extensions': False,
+                'autoload_known_extensions': False,
+            }
+    return config
+
+
+def install_extension(extension_dir:str=EXTENSION_DIR) -> None:
+    '''
+    Download the spatial extension into extension_dir (only needs to run once)
+    '''
+    if not exists(extension_dir):
+        makedirs(extension_dir)
+
+    conn = duckdb.connect(database=':memory:', config=get_config(extension_dir))
+    conn.execute("INSTALL spatial;")
+    conn.close()
+
+
+def define_ports_view(conn:duckdb.DuckDBPyConnection) -> None:
+    '''
+    Create the ports_data view over ports.csv
+    '''
+    header = get_port_header()
+    schema_items = [f"'{col}': '{dtype}'" for col, dtype in header.items()]
+    schema_dict_str = "{" + ", ".join(schema_items) + "}"
+
+    create_ports_sql = f"""
+        CREATE OR REPLACE VIEW ports_data AS
+        SELECT
+            RANK,
+            NAME,
+            STATE,
+            CAST(REPLACE(TONNAGE, ',', '') AS INTEGER) AS TONNAGE,
+            LAT,
+            LON
+        FROM read_csv ('{PORTS_FNAME}', HEADER=True, columns={schema_dict_str}, ignore_errors=false)
+        """
+    conn.execute(create_ports_sql)
+
+
+def get_data_glob(data_dir:str) -> str:
+    return join(data_dir, '**', '*.parquet')
+
+
+def define_views(conn:duckdb.DuckDBPyConnection, data_dir:str=DATA_DIR) -> None:
+    '''
+    Create the views and macros shared by the scripts
+    '''
+    # DuckDB expands the glob itself, so the view picks up new parquet files
+    # without having to be rebuilt
+    data_glob = get_data_glob(data_dir)
+    try:
+        conn.execute(f"CREATE OR REPLACE VIEW ais AS SELECT * FROM read_parquet('{data_glob}')")
+    except duckdb.IOException as e:
+        raise RuntimeError(f'No AIS parquet files found in {data_dir}, set AIS_DATA_DIR to the converted data') from e
+
+    define_ports_view(conn)
+
+    # Distance in meters between two lon/lat points
+    # (ST_Distance_Sphere wants its points in lat/lon axis order)
+    conn.execute("""
+        CREATE OR REPLACE MACRO dist_m(lon1, lat1, lon2, lat2) AS
+            ST_Distance_Sphere(ST_Point(lat1, lon1), ST_Point(lat2, lon2))
+        """)
+
+    # AIS points for a time window as geometries
+    conn.execute("""
+        CREATE OR REPLACE MACRO ais_window(start_ts, end_ts) AS TABLE
+            SELECT MMSI, BaseDateTime, VesselName, ST_Point(LON, LAT) AS geom
+            FROM ais
+            WHERE BaseDateTime BETWEEN start_ts AND end_ts
+        """)
+
+    # Points for a time window collapsed into one point per run of nearby fixes
+    # (ST_Distance_Spheroid also wants lat/lon axis order, hence the flips)
+    conn.execute("""
+        CREATE OR REPLACE MACRO clustered_points(start_ts, end_ts, gap) AS TABLE
+        WITH ordered_points AS (
+            SELECT
+                MMSI,
+                BaseDateTime,
+                VesselName,
+                geom,
+                LAG(geom) OVER (PARTITION BY MMSI ORDER BY BaseDateTime) AS prev_geom
+            FROM ais_window(start_ts, end_ts)
+        ),
+        clusters AS (
+            SELECT
+                MMSI,
+                BaseDateTime,
+                VesselName,
+                geom,
+                CASE
+                    WHEN prev_geom IS NULL
+                        OR ST_Distance_Spheroid(ST_FlipCoordinates(geom), ST_FlipCoordinates(prev_geom)) > gap THEN 1
+                    ELSE 0
+                END AS cluster_gap
+            FROM ordered_points
+        ),
+        cum_clusters AS (
+            SELECT
+                MMSI,
+                BaseDateTime,
+                VesselName,
+                geom,
+                SUM(cluster_gap) OVER (PARTITION BY MMSI ORDER BY BaseDateTime) AS cluster_id
+            FROM clusters
+        ),
+        cluster_centers AS (
+            SELECT
+                MMSI,
+                MIN(BaseDateTime) AS BaseDateTime,
+                MIN(VesselName) AS VesselName,
+                ST_Point(AVG(ST_X(geom)), AVG(ST_Y(geom))) AS geom,
+                cluster_id
+            FROM cum_clusters
+            GROUP BY MMSI, cluster_id
+        )
+        SELECT
+            MMSI,
+            BaseDateTime,
+            VesselName,
+            ST_Y(geom) AS lat,
+            ST_X(geom) AS lon
+        FROM cluster_centers
+        """)
+
+    # Remember which data the views were built over
+    conn.execute("CREATE OR REPLACE TABLE ais_settings (key VARCHAR PRIMARY KEY, value VARCHAR)")
+    conn.execute("INSERT INTO ais_settings VALUES ('data_glob', ?), ('ports_fname', ?), ('version', ?)",
+                 [data_glob, PORTS_FNAME, VIEWS_VERSION])
+
+
+def views_current(conn:duckdb.DuckDBPyConnection, data_dir:str=DATA_DIR) -> bool:
+    '''
+    True if the views and macros exist and were built over data_dir
+    '''
+    views = conn.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal").fetchall()
+    macros = conn.execute("SELECT function_name FROM duckdb_functions() WHERE schema_name = 'main' AND NOT internal").fetchall()
+    names = {n[0] for n in views + macros}
+    if not {'ais', 'ports_data', 'dist_m', 'ais_window', 'clustered_points'} <= names:
+        return False
+
+    tables = conn.execute("SELECT table_name FROM duckdb_tables() WHERE NOT internal").fetchall()
+    if ('ais_settings',) not in tables:
+        return False
+
+    settings = dict(conn.execute("SELECT key, value FROM ais_settings").fetchall())
+    return (settings.get('data_glob') == get_data_glob(data_dir)
+            and settings.get('ports_fname') == PORTS_FNAME
+            and settings.get('version') == VIEWS_VERSION)
+
+
+def connect_spatial(db_path:str, extension_dir:str, read_only:bool) -> duckdb.DuckDBPyConnection:
+    '''
+    Open db_path with the spatial extension loaded from extension_dir
+    '''
+    try:
+        conn = duckdb.connect(database=db_path, read_only=read_only, config=get_config(extension_dir))
+    except duckdb.IOException as e:
+        raise RuntimeError(f'Could not open {db_path}, it is open in another process (e.g. query_service.py). '
+                           'Stop it and run: python connection.py --rebuild') from e
+
+    try:
+        conn.execute("LOAD spatial;")
+    except duckdb.IOException as e:
+        conn.close()
+        raise RuntimeError(f'Spatial extension not found in {extension_dir}, run: python connection.py --install') from e
+
+    return conn
+
+
+def setup_database(db_path:str=DB_PATH, extension_dir:str=EXTENSION_DIR, data_dir:str=DATA_DIR) -> None:
+    '''
+    (Re)build the views and macros, the only time the database is opened read-write
+    '''
+    conn = connect_spatial(db_path, extension_dir, read_only=False)
+    try:
+        define_views(conn, data_dir)
+    finally:
+        conn.close()
+
+
+def get_connection(db_path:str=DB_PATH, extension_dir:str=EXTENSION_DIR, data_dir:str=DATA_DIR,
+                   rebuild:bool=False) -> duckdb.DuckDBPyConnection:
+    '''
+    Connect read-only to the persistent AIS database with spatial loaded and views defined.
+    Read-only connections let scripts, notebooks and the query service share the file.
+    '''
+    if rebuild or not exists(db_path):
+        setup_database(db_path, extension_dir, data_dir)
+
+    conn = connect_spatial(db_path, extension_dir, read_only=True)
+    if not views_current(conn, data_dir):
+        # Built over a different data dir (or by an older version), rebuild once
+        conn.close()
+        setup_database(db_path, extension_dir, data_dir)
+        conn = connect_spatial(db_path, extension_dir, read_only=True)
+
+    return conn
+
+
+def get_ports_connection() -> duckdb.DuckDBPyConnection:
+    '''
+    In-memory connection with only the ports_data view (no spatial extension or AIS data needed)
+    '''
+    conn = duckdb.connect(database=':memory:', read_only=False)
+    define_ports_view(conn)
+    return conn
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Set up the local spatial extension and persistent AIS database.')
+    parser.add_argument('--install', action='store_true', help='Download the spatial extension into the extension directory.')
+    parser.add_argument('--rebuild', action='store_true', help='Recreate the views and macros.')
+
+    args = parser.parse_args()
+
+    if args.install:
+        install_extension()
+        print(f'Spatial extension installed to {EXTENSION_DIR}')
+
+    start_time = time.perf_counter()
+    conn = get_connection(rebuild=args.rebuild)
+    print(f'Connected to {DB_PATH} in {time.perf_counter() - start_time:.3f}s')
+    conn.close()
@@ -1,22 +1,8 @@
-import duckdb
+from connection import get_connection
 
-#import pandas as pd
 
-import glob 
-import os.path
-
-
-# Connect to DB (and load geo extension)
-conn = duckdb.connect() #config={'allow_unsigned_extensions' : 'true'}) 
-conn.execute("INSTALL spatial; LOAD spatial;")
-#conn = duckdb.connect()
-
-# Get list of parquet files to import into duckdb
-data_dir = '/Users/ella/Documents/luna/ais_data/**/*.parquet'
-data_list = list(filter(lambda x: not os.path.isdir(x), glob.glob(data_dir, recursive=True) ))
-
-# Create Table like thing
-conn.execute(f"CREATE VIEW ais AS SELECT * FROM read_parquet({data_list})")
+# Connect to DB (spatial extension and ais view come from the local database)
+conn = get_connection()
 
 conn.execute("SELECT COUNT(*) FROM ais")
 
@@ -31,7 +17,7 @@ sql_s = f"\
                 WHERE BaseDateTime BETWEEN '{start}' AND '{end}' \
             )\
             SELECT COUNT(*) FROM timeTable \
-            WHERE ST_Distance_Sphere( ST_POINT(LON, LAT), ST_POINT({lon}, {lat}) ) < {max_dist} \
+            WHERE dist_m(LON, LAT, {lon}, {lat}) < {max_dist} \
         "
 
 # Remove COUNT(*) to get dataframe
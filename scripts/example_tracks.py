@@ -1,23 +1,13 @@
-import duckdb
-import folium
 import json
-import glob 
-import os.path
+
+from connection import get_connection
 
 def style_function(feature):
     return {'color': '#6C2CED', 'weight': 3, 'opacity': 0.7}
 
 if __name__ == '__main__':
-    # Connect to DB (and load geo extension)
-    conn = duckdb.connect()
-    conn.execute("INSTALL spatial; LOAD spatial;")
-
-    # Get list of parquet files to import into duckdb
-    data_dir = '/Users/ella/Documents/luna/ais_data/**/*.parquet'
-    data_list = list(filter(lambda x: not os.path.isdir(x), glob.glob(data_dir, recursive=True) ))
-
-    # Create Table like thing
-    conn.execute(f"CREATE VIEW ais AS SELECT * FROM read_parquet({data_list})")
+    # Connect to DB (spatial extension and ais view come from the local database)
+    conn = get_connection()
 
     conn.execute("SELECT COUNT(*) FROM ais")
 
@@ -27,7 +17,7 @@ if __name__ == '__main__':
 
     # Load data from time range and create a persistent view for TimeTable
     sql_s = f"""\
-            CREATE OR REPLACE VIEW TimeTable AS \
+            CREATE OR REPLACE TEMPORARY VIEW TimeTable AS \
             SELECT MMSI, BaseDateTime, LAT, LON \
             FROM ais \
             WHERE BaseDateTime BETWEEN '{start}' AND '{end}'
@@ -58,16 +48,13 @@ if __name__ == '__main__':
     # Create a temporary table for filtered AIS data including VesselName
     filtered_ais_sql = f"""\
             CREATE OR REPLACE TEMPORARY VIEW filtered_ais AS 
-            SELECT MMSI, BaseDateTime, VesselName,
-                ST_Point(LON, LAT) AS geom
-            FROM ais
-            WHERE BaseDateTime BETWEEN '{start}' AND '{end}'
+            SELECT * FROM ais_window(TIMESTAMP '{start}', TIMESTAMP '{end}')
         """
     conn.execute(filtered_ais_sql)
 
     # Create the spatial_tracks view, propagating VesselName
     spatial_tracks_sql = f"""\
-        CREATE OR REPLACE VIEW spatial_tracks AS 
+        CREATE OR REPLACE TEMPORARY VIEW spatial_tracks AS 
         WITH ordered_points AS (
             SELECT 
                 MMSI, 
@@ -127,6 +114,9 @@ if __name__ == '__main__':
         print("No coordinates found in first track.")
         exit()
     start_lon, start_lat = first_coords[0]
+
+    # Only pay for folium once there is something to plot
+    import folium
     m = folium.Map(location=[start_lat, start_lon], zoom_start=10)
 
     # For each track, create a GeoJSON feature with MMSI and VesselName displayed on click
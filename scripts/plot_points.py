@@ -1,79 +1,19 @@
-import duckdb
-import folium
-import glob 
-import os.path
+from connection import get_connection
 
 if __name__ == '__main__':
-    # Connect to DB (and load geo extension)
-    conn = duckdb.connect()
-    conn.execute("INSTALL spatial; LOAD spatial;")
+    # Connect to DB (spatial extension and ais view come from the local database)
+    conn = get_connection()
 
     '''
     Load AIS Data and Cluster Points
     '''
-    # Get list of parquet files to import into duckdb
-    data_dir = '/Users/ella/Documents/luna/ais_data/**/*.parquet'
-    data_list = list(filter(lambda x: not os.path.isdir(x), glob.glob(data_dir, recursive=True) ))
-    
-    # Create view over AIS data
-    conn.execute(f"CREATE VIEW ais AS SELECT * FROM read_parquet({data_list})")
-    
     # Define one-day timeframe for January 1, 2022
     start = '2022-01-01 00:00:00'
     end = '2022-01-02 00:00:00'
     
-    # Cluster points query:
-    sql_s = f"""\
-        WITH ordered_points AS (
-            SELECT
-                MMSI,
-                BaseDateTime,
-                VesselName,
-                ST_Point(LON, LAT) AS geom,
-                LAG(ST_Point(LON, LAT)) OVER (PARTITION BY MMSI ORDER BY BaseDateTime) AS prev_geom
-            FROM ais
-            WHERE BaseDateTime BETWEEN '{start}' AND '{end}'
-        ),
-        clusters AS (
-            SELECT
-                MMSI,
-                BaseDateTime,
-                VesselName,
-                geom,
-                CASE 
-                    WHEN prev_geom IS NULL OR ST_Distance_Spheroid(geom, prev_geom) > 100 THEN 1 
-                    ELSE 0 
-                END AS cluster_gap
-            FROM ordered_points
-        ),
-        cum_clusters AS (
-            SELECT
-                MMSI,
-                BaseDateTime,
-                VesselName,
-                geom,
-                SUM(cluster_gap) OVER (PARTITION BY MMSI ORDER BY BaseDateTime) AS cluster_id
-            FROM clusters
-        ),
-        clustered_points AS (
-            SELECT
-                MMSI,
-                MIN(BaseDateTime) AS BaseDateTime,
-                MIN(VesselName) AS VesselName,
-                ST_Point(AVG(ST_X(geom)), AVG(ST_Y(geom))) AS geom,
-                cluster_id
-            FROM cum_clusters
-            GROUP BY MMSI, cluster_id
-        )
-        SELECT
-            MMSI,
-            BaseDateTime,
-            VesselName,
-            ST_Y(geom) AS lat,
-            ST_X(geom) AS lon
-        FROM clustered_points
-    """
-    conn.execute(f"CREATE TABLE clustered_points AS {sql_s}")
+    # Cluster points (fixes closer than 100m to the previous one are merged)
+    sql_s = f"SELECT * FROM clustered_points(TIMESTAMP '{start}', TIMESTAMP '{end}', 100)"
+    conn.execute(f"CREATE OR REPLACE TEMPORARY TABLE clustered_points AS {sql_s}")
 
     # Print number of rows
     print(f"Number of rows in clustered_points: {conn.execute('SELECT COUNT(*) FROM clustered_points').fetchone()[0]}")
@@ -86,6 +26,9 @@ if __name__ == '__main__':
         print("No data found for January 1, 2022.")
         exit()
 
+    # Only pay for folium once there is something to plot
+    import folium
+
     # Create a folium map centered on the first cluster point
     center_lat, center_lon = rows[0][3], rows[0][4]
     my_map = folium.Map(location=[center_lat, center_lon], zoom_start=10)
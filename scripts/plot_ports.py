@@ -1,45 +1,8 @@
-import duckdb
-import folium
-
-import glob
-import os.path 
-
-def get_header() -> dict:
-    schema = {
-                'RANK': 'INTEGER',
-                'NAME': 'VARCHAR',
-                'STATE': 'VARCHAR',
-                'TONNAGE': 'VARCHAR',  # Will be converted to INTEGER when loaded
-                'LAT': 'FLOAT',
-                'LON': 'FLOAT',
-            }
-    return schema
+from connection import get_ports_connection
 
 if __name__ == '__main__':
-    conn = duckdb.connect(database=':memory:', read_only=False)
-
-    # Load the ports data
-    ports_fname = '../gps_points/ports.csv'
-    # Create column definitions dictionary for SQL
-    header = get_header()
-    schema_items = [f"'{col}': '{dtype}'" for col, dtype in header.items()]
-    schema_dict_str = "{" + ", ".join(schema_items) + "}"
-
-    # Construct the SQL statement for creating a view and filtering data
-    # Construct the SQL statement for creating a view and filtering data
-    create_view_sql = f"""
-        CREATE OR REPLACE VIEW ports_data AS
-        SELECT 
-            RANK,
-            NAME,
-            STATE,
-            CAST(REPLACE(TONNAGE, ',', '') AS INTEGER) AS TONNAGE,
-            LAT,
-            LON
-        FROM read_csv ('{ports_fname}', HEADER=True, columns={schema_dict_str}, ignore_errors=false)
-        """
-
-    conn.execute(create_view_sql)
+    # Ports only, so skip the spatial extension and AIS database
+    conn = get_ports_connection()
 
     # Check we loaded the data
     count_result = conn.execute("SELECT COUNT(*) FROM ports_data").fetchall()
@@ -59,6 +22,8 @@ if __name__ == '__main__':
         largest_port = max(port_data, key=lambda p: p[3])  # p[3] is the tonnage
         zoom_point = [largest_port[4], largest_port[5]]  # lat, lon
     
+    # Only pay for folium once there is something to plot
+    import folium
     m = folium.Map(location=zoom_point, zoom_start=5)
     
     # Add markers with popup information for any ports we have
@@ -1,42 +1,19 @@
-import duckdb
-import folium
 import json
-import glob 
-import os.path
+
+from connection import get_connection
 
 def style_function(feature):
     return {'color': '#6C2CED', 'weight': 3, 'opacity': 0.7}
 
-def get_port_header() -> dict:
-    schema = {
-                'RANK': 'INTEGER',
-                'NAME': 'VARCHAR',
-                'STATE': 'VARCHAR',
-                'TONNAGE': 'VARCHAR',  # Will be converted to INTEGER when loaded
-                'LAT': 'FLOAT',
-                'LON': 'FLOAT',
-            }
-    return schema
-
 if __name__ == '__main__':
-    # Connect to DB (and load geo extension)
-    conn = duckdb.connect()
-    conn.execute("INSTALL spatial; LOAD spatial;")
+    # Connect to DB (spatial extension and ais view come from the local database)
+    conn = get_connection()
 
     '''
     Load AIS Data
     Load Ports
     Filter AIS data to only include vessels within 500m of a port
     '''
-    # Get list of parquet files to import into duckdb
-    data_dir = '/Users/ella/Documents/luna/ais_data/**/*.parquet'
-    data_list = list(filter(lambda x: not os.path.isdir(x), glob.glob(data_dir, recursive=True) ))
-
-    # Create Table like thing
-    conn.execute(f"CREATE VIEW ais AS SELECT * FROM read_parquet({data_list})")
-
-    conn.execute("SELECT COUNT(*) FROM ais")
-
     # Just pull data for 1 day right now
     start = '2022-06-01 00:00:00'
     end = '2022-06-02 00:00:00'
@@ -44,16 +21,13 @@ if __name__ == '__main__':
     # Create a temporary table for filtered AIS data including VesselName
     filtered_ais_sql = f"""\
             CREATE OR REPLACE TEMPORARY VIEW filtered_ais AS 
-            SELECT MMSI, BaseDateTime, VesselName,
-                ST_Point(LON, LAT) AS geom
-            FROM ais
-            WHERE BaseDateTime BETWEEN '{start}' AND '{end}'
+            SELECT * FROM ais_window(TIMESTAMP '{start}', TIMESTAMP '{end}')
         """
     conn.execute(filtered_ais_sql)
 
     # Create the spatial_tracks view, propagating VesselName
     spatial_tracks_sql = f"""\
-        CREATE OR REPLACE VIEW spatial_tracks AS 
+        CREATE OR REPLACE TEMPORARY VIEW spatial_tracks AS 
         WITH ordered_points AS (
             SELECT 
                 MMSI, 
@@ -129,27 +103,6 @@ if __name__ == '__main__':
         """
     conn.execute(f"{spatial_tracks_sql}")
 
-    # Load Port Data
-    ports_fname = '../gps_points/ports.csv'
-    # Create column definitions dictionary for SQL
-    header = get_port_header()
-    schema_items = [f"'{col}': '{dtype}'" for col, dtype in header.items()]
-    schema_dict_str = "{" + ", ".join(schema_items) + "}"
-
-    # Construct the SQL statement for creating a view and filtering data
-    create_view_sql = f"""
-        CREATE OR REPLACE VIEW ports_data AS
-        SELECT 
-            RANK,
-            NAME,
-            STATE,
-            CAST(REPLACE(TONNAGE, ',', '') AS INTEGER) AS TONNAGE,
-            LAT,
-            LON
-        FROM read_csv ('{ports_fname}', HEADER=True, columns={schema_dict_str}, ignore_errors=false)
-        """
-    conn.execute(create_view_sql)
-
     # Only take the center of the tracks that are within 100m of a port (not perfect, but good enough for now)
     # Also want to limit the number of tracks to 10,000 for performance
     sql_query = f"""
@@ -177,6 +130,9 @@ if __name__ == '__main__':
         print("No coordinates found in first track.")
         exit()
     start_lon, start_lat = first_coords[0]
+
+    # Only pay for folium once there is something to plot
+    import folium
     m = folium.Map(location=[start_lat, start_lon], zoom_start=10)
 
     # For each track, create a GeoJSON feature with MMSI and VesselName displayed on click
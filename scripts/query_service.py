@@ -0,0 +1,291 @@
+'''
+Long running local query service over the AIS database.
+
+Keeps a pool of read-only DuckDB connections open so repeated lookups from
+notebooks or map front-ends skip connection and view setup. The database is
+created on first use; run `python connection.py --install` once for the
+spatial extension.
+
+Endpoints (GET, query string parameters):
+    /count        lat, lon, radius, start, end
+    /track        mmsi, start, end
+    /port_visits  start, end, radius
+    /clusters     start, end, gap, limit
+    /metrics      per endpoint latency
+
+Add format=arrow to get an Arrow IPC stream instead of JSON.
+'''
+import argparse
+import json
+import queue
+import threading
+import time
+import math
+from datetime import datetime
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import mean, median
+from urllib.parse import urlparse, parse_qs
+
+import duckdb
+
+from connection import get_connection, DB_PATH
+
+# Meters per degree of latitude, used for a cheap bounding box before the distance check.
+# Rounded down from ~111195 (dist_m's sphere) so the box is never tighter than dist_m
+M_PER_DEG = 110000.0
+
+COUNT_SQL = f"""
+    SELECT COUNT(*) AS count
+    FROM ais
+    WHERE BaseDateTime BETWEEN $start::TIMESTAMP AND $end::TIMESTAMP
+        AND LAT BETWEEN $lat - $radius / {M_PER_DEG} AND $lat + $radius / {M_PER_DEG}
+        AND dist_m(LON, LAT, $lon, $lat) < $radius
+"""
+
+TRACK_SQL = """
+    SELECT MMSI, BaseDateTime, LAT, LON, SOG, COG, Heading, VesselName
+    FROM ais
+    WHERE MMSI = $mmsi
+        AND BaseDateTime BETWEEN $start::TIMESTAMP AND $end::TIMESTAMP
+    ORDER BY BaseDateTime
+"""
+
+PORT_VISITS_SQL = f"""
+    SELECT
+        p.NAME,
+        p.STATE,
+        COUNT(DISTINCT a.MMSI) AS vessels,
+        COUNT(*) AS points
+    FROM ports_data p
+    JOIN ais a
+        ON a.LAT BETWEEN p.LAT - $radius / {M_PER_DEG} AND p.LAT + $radius / {M_PER_DEG}
+        AND dist_m(a.LON, a.LAT, p.LON, p.LAT) < $radius
+    WHERE a.BaseDateTime BETWEEN $start::TIMESTAMP AND $end::TIMESTAMP
+    GROUP BY p.NAME, p.STATE
+    ORDER BY vessels DESC
+"""
+
+# Clustering is shared with plot_points.py through the clustered_points macro
+CLUSTERS_SQL = """
+    SELECT *
+    FROM clustered_points($start::TIMESTAMP, $end::TIMESTAMP, $gap)
+    ORDER BY MMSI, BaseDateTime
+    LIMIT $limit
+"""
+
+
+def timestamp(value:str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def finite_float(value:str) -> float:
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(value)
+    return value
+
+
+def positive_float(value:str) -> float:
+    value = finite_float(value)
+    if not (math.isfinite(value) and value > 0):
+        raise ValueError(value)
+    return value
+
+
+def non_negative_int(value:str) -> int:
+    value = int(value)
+    if value < 0:
+        raise ValueError(value)
+    return value
+
+
+# endpoint -> (sql, {param: type}, {param: default})
+ENDPOINTS = {
+    '/count': (COUNT_SQL, {'lat': finite_float, 'lon': finite_float, 'radius': positive_float, 'start': timestamp, 'end': timestamp},
+               {'radius': 500.0}),
+    '/track': (TRACK_SQL, {'mmsi': str, 'start': timestamp, 'end': timestamp}, {}),
+    '/port_visits': (PORT_VISITS_SQL, {'start': timestamp, 'end': timestamp, 'radius': positive_float}, {'radius': 500.0}),
+    '/clusters': (CLUSTERS_SQL, {'start': timestamp, 'end': timestamp, 'gap': positive_float, 'limit': non_negative_int},
+                  {'gap': 100.0, 'limit': 100000}),
+}
+
+FORMATS = ('json', 'arrow')
+
+
+class ConnectionPool:
+    '''
+    Fixed size pool of read-only connections to the same database
+    '''
+    def __init__(self, size:int, db_path:str=DB_PATH, timeout:float=30.0):
+        if size < 1:
+            raise ValueError(f'Pool size must be at least 1, got {size}')
+        self.timeout = timeout
+        # Cursors share the database instance (and the loaded spatial extension)
+        # but each one can run a query on its own thread
+        self.conn = get_connection(db_path=db_path)
+        self.pool = queue.Queue()
+        for _ in range(size):
+            self.pool.put(self.conn.cursor())
+
+    @contextmanager
+    def connection(self):
+        # Raises queue.Empty if every connection stays busy for timeout seconds
+        cursor = self.pool.get(timeout=self.timeout)
+        try:
+            yield cursor
+        finally:
+            self.pool.put(cursor)
+
+    def close(self) -> None:
+        while not self.pool.empty():
+            self.pool.get().close()
+        self.conn.close()
+
+
+class Metrics:
+    '''
+    Latency of the most recent requests per endpoint
+    '''
+    def __init__(self, window:int=1000):
+        self.lock = threading.Lock()
+        self.window = window
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint:str, seconds:float, ok:bool=True) -> None:
+        with self.lock:
+            self.latencies.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self) -> dict:
+        with self.lock:
+            summary = {}
+            for endpoint, times in self.latencies.items():
+                times = sorted(times)
+                summary[endpoint] = {
+                    'count': len(times),
+                    'errors': self.errors.get(endpoint, 0),
+                    'mean_ms': 1000 * mean(times),
+                    'p50_ms': 1000 * median(times),
+                    # Nearest rank, so p95 is never below p50
+                    'p95_ms': 1000 * times[math.ceil(0.95 * len(times)) - 1],
+                    'max_ms': 1000 * times[-1],
+                }
+            return summary
+
+
+def parse_params(query:dict, types:dict, defaults:dict) -> dict:
+    '''
+    Pull the typed parameters for an endpoint out of the query string
+    '''
+    params = {}
+    for name, cast in types.items():
+        if name in query:
+            try:
+                params[name] = cast(query[name][0])
+            except ValueError:
+                raise ValueError(f'Bad value for {name}: {query[name][0]}')
+        elif name in defaults:
+            params[name] = defaults[name]
+        else:
+            raise ValueError(f'Missing parameter: {name}')
+    return params
+
+
+def pool_size(value:str) -> int:
+    size = int(value)
+    if size < 1:
+        raise argparse.ArgumentTypeError(f'pool size must be at least 1, got {size}')
+    return size
+
+
+def make_handler(pool:ConnectionPool, metrics:Metrics):
+    class Handler(BaseHTTPRequestHandler):
+        def send(self, status:int, body:bytes, content_type:str='application/json') -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status:int, obj) -> None:
+            self.send(status, json.dumps(obj, default=str).encode())
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path == '/metrics':
+                self.send_json(200, metrics.summary())
+                return
+
+            if url.path not in ENDPOINTS:
+                self.send_json(404, {'error': f'Unknown endpoint: {url.path}'})
+                return
+
+            start_time = time.perf_counter()
+            ok = False
+            try:
+                sql, types, defaults = ENDPOINTS[url.path]
+                params = parse_params(query, types, defaults)
+                fmt = query.get('format', ['json'])[0]
+                if fmt not in FORMATS:
+                    raise ValueError(f'Unknown format: {fmt}, expected one of {", ".join(FORMATS)}')
+                as_arrow = fmt == 'arrow'
+
+                with pool.connection() as cursor:
+                    result = cursor.execute(sql, params)
+                    if as_arrow:
+                        # Materialise before the cursor goes back to the pool
+                        table = result.fetch_arrow_table()
+                    else:
+                        columns = [d[0] for d in result.description]
+                        rows = result.fetchall()
+
+                if as_arrow:
+                    import pyarrow as pa
+                    sink = pa.BufferOutputStream()
+                    with pa.ipc.new_stream(sink, table.schema) as writer:
+                        writer.write_table(table)
+                    self.send(200, sink.getvalue().to_pybytes(), 'application/vnd.apache.arrow.stream')
+                else:
+                    self.send_json(200, {'columns': columns, 'rows': rows})
+                ok = True
+            except (ValueError, duckdb.ConversionException, duckdb.InvalidInputException) as e:
+                self.send_json(400, {'error': str(e)})
+            except queue.Empty:
+                self.send_json(503, {'error': 'All connections are busy, try again later'})
+            except Exception as e:
+                self.send_json(500, {'error': str(e)})
+            finally:
+                metrics.record(url.path, time.perf_counter() - start_time, ok)
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve AIS lookups over HTTP from a pool of read-only DuckDB connections.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to bind to.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on.')
+    parser.add_argument('--pool-size', type=pool_size, default=4, help='Number of pooled connections.')
+    parser.add_argument('--pool-timeout', type=float, default=30.0, help='Seconds to wait for a free connection before returning 503.')
+    parser.add_argument('--db', type=str, default=DB_PATH, help='Path to the AIS database file.')
+
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.pool_size, args.db, args.pool_timeout)
+    metrics = Metrics()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(pool, metrics))
+
+    print(f'Serving on http://{args.host}:{args.port} with {args.pool_size} connections')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        print(json.dumps(metrics.summary(), indent=2))